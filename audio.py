@@ -1,6 +1,10 @@
 import sounddevice as sd
 import numpy as np
-import pyogg
+from opusCodec import OpusEncoder, OpusDecoder
+from threadPriority import make_current_thread_realtime
+import collections
+import queue
+import threading
 import time
 
 # Constants for audio processing. SRS uses a 48kHz sample rate.
@@ -8,12 +12,128 @@ SAMPLE_RATE = 48000
 # A common block size for VoIP applications (e.g., 10ms frames for Opus codec)
 # 48000 Hz * 0.010 s = 480 frames
 BLOCK_SIZE = 480
+# Number of PCM blocks buffered between the mic callback and the encoder thread (320ms).
+MIC_RING_SLOTS = 32
+# Number of decoded PCM blocks buffered ahead of the speaker callback (160ms).
+OUT_RING_SLOTS = 16
+# Duration of one block, in seconds.
+BLOCK_DURATION = BLOCK_SIZE / SAMPLE_RATE
+
+# Jitter buffer tuning. Playback (re)starts once this many blocks are queued; the
+# depth grows with the measured jitter, between the minimum and maximum below.
+JITTER_MIN_DEPTH = 2
+JITTER_MAX_DEPTH = OUT_RING_SLOTS - 2
+# Smoothing factor for the jitter estimate (the 1/16 used by RTP, RFC 3550).
+JITTER_EWMA_ALPHA = 1 / 16
+# Gaps longer than this are pauses between transmissions, not network jitter.
+JITTER_MAX_INTERVAL = 0.5
+
+# Speaker boost is applied as a fixed-point gain with GAIN_SHIFT fractional bits.
+# The ceiling keeps the int32 product of a full-scale sample and the gain in range.
+GAIN_SHIFT = 12
+UNITY_GAIN = 1 << GAIN_SHIFT
+MAX_GAIN = (2**31 - 1) // 32768
+
+class FrameRing:
+    """
+    A fixed-size single-producer/single-consumer ring of int16 PCM blocks.
+
+    The producer only ever advances `head` and the consumer only ever advances `tail`,
+    so neither side takes a lock. All storage is allocated up front, which makes
+    both ends safe to use from sounddevice's realtime callback thread.
+    """
+    def __init__(self, slots: int, block_size: int = BLOCK_SIZE):
+        self._frames = np.zeros((slots, block_size), dtype=np.int16)
+        # Pre-built row views, so indexing a slot does not create a new array object.
+        self._slots = list(self._frames)
+        self._size = slots
+        self.head = 0
+        self.tail = 0
+
+    def push(self, frame: np.ndarray) -> bool:
+        """
+        Copies a block into the ring. Returns False (dropping the block) if the ring is full.
+        A block shorter than the slot size is padded with silence.
+        """
+        head = self.head
+        if head - self.tail >= self._size:
+            return False
+        slot = self._slots[head % self._size]
+        count = len(frame)
+        if count == len(slot):
+            np.copyto(slot, frame)
+        else:
+            slot[:count] = frame
+            slot[count:] = 0
+        # Publish the slot only after its data has been written.
+        self.head = head + 1
+        return True
+
+    def pop_into(self, out: np.ndarray) -> bool:
+        """Copies the oldest block into `out`. Returns False if the ring is empty."""
+        tail = self.tail
+        if tail == self.head:
+            return False
+        np.copyto(out, self._slots[tail % self._size])
+        self.tail = tail + 1
+        return True
+
+    def __len__(self) -> int:
+        """The number of blocks currently queued."""
+        return self.head - self.tail
+
+class JitterBuffer:
+    """
+    Queues received Opus packets between the network thread and the playback thread.
+
+    It also keeps a running estimate of the jitter in packet arrival times, which the
+    playback side uses to decide how much audio to buffer before it starts playing.
+    """
+    def __init__(self, max_packets: int = 64):
+        # When full, the oldest packet is dropped to keep latency bounded.
+        self._packets = collections.deque(maxlen=max_packets)
+        self._ready = threading.Condition()
+        self._last_arrival = None
+        self._mean_interval = 0.0
+        self.jitter = 0.0 # Smoothed deviation of inter-arrival times, in seconds
+
+    def put(self, packet: bytes):
+        """Adds a packet and updates the jitter estimate. Never blocks on the consumer."""
+        now = time.monotonic()
+        with self._ready:
+            if self._last_arrival is not None:
+                interval = now - self._last_arrival
+                if interval < JITTER_MAX_INTERVAL:
+                    self.jitter += (abs(interval - self._mean_interval) - self.jitter) * JITTER_EWMA_ALPHA
+                    self._mean_interval += (interval - self._mean_interval) * JITTER_EWMA_ALPHA
+            self._last_arrival = now
+            self._packets.append(packet)
+            self._ready.notify()
+
+    def get(self, timeout: float):
+        """Returns the oldest packet, waiting up to `timeout` seconds. Returns None on timeout."""
+        with self._ready:
+            if not self._packets and not self._ready.wait(timeout):
+                return None
+            return self._packets.popleft() if self._packets else None
+
+    def wake(self):
+        """Wakes up a consumer blocked in get(), e.g. so it can notice a shutdown."""
+        with self._ready:
+            self._ready.notify_all()
+
+    @property
+    def target_depth(self) -> int:
+        """The number of decoded blocks to buffer before playback starts."""
+        # Cover roughly two standard deviations' worth of arrival jitter.
+        depth = JITTER_MIN_DEPTH + int(2 * self.jitter / BLOCK_DURATION)
+        return min(depth, JITTER_MAX_DEPTH)
 
 class AudioManager:
     """
     Manages audio input and output streams using sounddevice.
     """
-    def __init__(self, input_device: str, output_device: str, encoded_mic_callback: callable, speaker_boost_db: int = 0):
+    def __init__(self, input_device: str, output_device: str, encoded_mic_callback: callable, speaker_boost_db: int = 0, audio_cpu: int = -1, transmit_gate: threading.Event = None):
         """
         Initializes the AudioManager.
 
@@ -22,35 +142,110 @@ class AudioManager:
             output_device: The name or index of the output device.
             encoded_mic_callback: The function to call with Opus-encoded microphone data.
             speaker_boost_db: amount to increase or decrease speaker volume in decibels
+            audio_cpu: CPU to pin the capture callback thread to, or -1 to leave it unpinned.
+            transmit_gate: If given, microphone audio is only encoded and passed to
+                           encoded_mic_callback while this event is set (e.g. while PTT is held).
         """
         self.input_device = input_device
         self.output_device = output_device
         self.encoded_mic_callback = encoded_mic_callback
+        self.transmit_gate = transmit_gate
 
         self.input_stream = None
         self.output_stream = None
 
-        # Correctly initialize the encoder and decoder using pyogg's API
-
-        _encoder = pyogg.OpusEncoder()
-        _encoder.set_sampling_frequency(SAMPLE_RATE)
-        _encoder.set_application('voip')
-        _encoder.set_channels(1)
-        self.encoder = _encoder
-        _decoder = pyogg.OpusDecoder()
-        _decoder.set_sampling_frequency(SAMPLE_RATE)
-        _decoder.set_channels(1)
-        self.decoder = _decoder
+        # The codec wrappers call libopus directly on our own buffers
+        self.encoder = OpusEncoder(SAMPLE_RATE, channels=1)
+        self.decoder = OpusDecoder(SAMPLE_RATE, channels=1)
+        # Setting the boost also precomputes the fixed-point gain used by play_audio().
         self.speaker_boost_db = speaker_boost_db
 
+        # Decoded audio is queued here and pulled by the output stream's callback, so
+        # callers of play_audio() never block on the audio device.
+        self._out_ring = FrameRing(OUT_RING_SLOTS)
+        # After an underrun the output callback plays silence until the jitter
+        # buffer's target depth has been queued again.
+        self._priming = True
+
+        # Packets passed to queue_audio() wait here and are decoded by the playback
+        # thread, so the network thread never waits on decoding or the audio device.
+        self._jitter_buffer = JitterBuffer()
+        self._playback_thread = None
+        self._playing = False
+
+        # The mic callback runs on sounddevice's realtime thread, so it only copies raw
+        # PCM into this ring. Opus encoding and the external callback run on a
+        # separate encoder thread that drains it.
+        self._mic_ring = FrameRing(MIC_RING_SLOTS)
+        self._mic_ready = threading.Event()
+        self._encoder_thread = None
+        self._capturing = False
+        # The capture thread belongs to PortAudio, so it is tuned from its first callback.
+        self.audio_cpu = audio_cpu
+        self._capture_thread_tuned = False
+
+        # Persistent buffer for the block currently being encoded. libopus reads it
+        # in place, so the encoder thread does not allocate anything per 10ms block.
+        self._mic_block = np.zeros(BLOCK_SIZE, dtype=np.int16)
+
+        # Capture status flags are handed to a separate thread for printing,
+        # keeping stdout writes off the realtime thread.
+        self._status_queue = queue.Queue()
+        self._status_thread = None
+
+        # Open the speaker stream right away. Some backends take a long time to start,
+        # and doing it on the first received packet would cut off the first words.
+        self._start_playback()
+
+    @property
+    def speaker_boost_db(self) -> float:
+        """The speaker volume adjustment in decibels."""
+        return self._speaker_boost_db
+
+    @speaker_boost_db.setter
+    def speaker_boost_db(self, value: float):
+        self._speaker_boost_db = value
+        self._gain_fixed = min(int(round(10 ** (value / 20) * UNITY_GAIN)), MAX_GAIN)
+
     def _mic_callback(self, indata: np.ndarray, frames: int, time, status: sd.CallbackFlags):
         """Internal callback to handle raw audio from sounddevice."""
         if status:
+            self._status_queue.put_nowait(status)
+
+        if not self._capture_thread_tuned:
+            self._capture_thread_tuned = True
+            if not make_current_thread_realtime(self.audio_cpu):
+                self._status_queue.put_nowait("no realtime priority for the capture thread")
+
+        # Nobody is listening, so skip the encoder entirely.
+        gate = self.transmit_gate
+        if gate is not None and not gate.is_set():
+            return
+
+        # Hand the raw audio to the encoder thread and wake it up
+        if self._mic_ring.push(indata.reshape(-1)):
+            self._mic_ready.set()
+        else:
+            self._status_queue.put_nowait("encoder is behind, block dropped")
+
+    def _encode_loop(self):
+        """Encodes captured blocks and passes the compressed packets to the external callback."""
+        while self._capturing:
+            # The timeout lets the loop notice stop_capture() even if no audio arrives.
+            self._mic_ready.wait(0.5)
+            self._mic_ready.clear()
+            while self._mic_ring.pop_into(self._mic_block):
+                # The packet is a view of the encoder's buffer, valid only during the callback.
+                encoded_packet = self.encoder.encode(self._mic_block)
+                self.encoded_mic_callback(encoded_packet)
+
+    def _status_loop(self):
+        """Prints capture status flags reported by the mic callback until stopped."""
+        while True:
+            status = self._status_queue.get()
+            if status is None:
+                break
             print(f"Microphone capture status: {status}")
-        
-        # Encode the raw audio and pass the compressed packet to the external callback
-        encoded_packet = self.encoder.encode(indata.tobytes())
-        self.encoded_mic_callback(encoded_packet)
 
     def start_capture(self):
         """Starts capturing audio from the microphone."""
@@ -68,11 +263,18 @@ class AudioManager:
                 blocksize=BLOCK_SIZE,
                 callback=self._mic_callback
             )
+            self._capturing = True
+            self._capture_thread_tuned = False
+            self._encoder_thread = threading.Thread(target=self._encode_loop, daemon=True)
+            self._encoder_thread.start()
             self.input_stream.start()
+            self._status_thread = threading.Thread(target=self._status_loop, daemon=True)
+            self._status_thread.start()
             print("Microphone capture started successfully.")
         except Exception as e:
             print(f"FATAL: Could not start microphone capture: {e}")
             self.input_stream = None
+            self._stop_encoder()
 
     def stop_capture(self):
         """Stops the microphone capture stream."""
@@ -81,42 +283,108 @@ class AudioManager:
         self.input_stream.stop()
         self.input_stream.close()
         self.input_stream = None
+        self._stop_encoder()
+        if self._status_thread:
+            # A None entry tells the status thread to exit.
+            self._status_queue.put(None)
+            self._status_thread.join()
+            self._status_thread = None
         print("Microphone capture stopped.")
 
-    def play_audio(self, encoded_packet: bytes):
-        """Decodes an Opus packet and plays it on the output device."""
-        # This is a simplified playback method. For a real client, we'll need a buffer.
-        if not self.output_stream:
-            # Start the output stream on the first playback request
-            try:
-                self.output_stream = sd.OutputStream(
-                    device=self.output_device,
-                    samplerate=SAMPLE_RATE,
-                    channels=1,
-                    dtype='int16',
-                    blocksize=BLOCK_SIZE
-                )
-                self.output_stream.start()
-            except Exception as e:
-                print(f"FATAL: Could not start audio playback: {e}")
-                self.output_stream = None
+    def _stop_encoder(self):
+        """Stops the encoder thread, if it is running."""
+        self._capturing = False
+        if self._encoder_thread:
+            self._mic_ready.set()
+            self._encoder_thread.join()
+            self._encoder_thread = None
+
+    def _out_callback(self, outdata: np.ndarray, frames: int, time, status: sd.CallbackFlags):
+        """Internal callback that feeds queued audio to sounddevice, or silence if there is none."""
+        ring = self._out_ring
+        if self._priming:
+            # Build up a cushion that covers the current network jitter before playing.
+            if len(ring) < self._jitter_buffer.target_depth:
+                outdata.fill(0)
                 return
+            self._priming = False
+        if not ring.pop_into(outdata[:, 0]):
+            outdata.fill(0)
+            self._priming = True
 
-        # Decode the packet and play it
-        decoded_pcm = self.decoder.decode(encoded_packet)
-        if decoded_pcm:
-            # Convert the raw bytes from the decoder into a NumPy array of int16
-            audio_array = np.frombuffer(decoded_pcm, dtype=np.int16)
-            # Reshape the array to be 2D: (n_samples, n_channels) which is (480, 1) here.
+    def _start_playback(self):
+        """Opens and starts the output stream. It plays silence until audio is queued."""
+        try:
+            self.output_stream = sd.OutputStream(
+                device=self.output_device,
+                samplerate=SAMPLE_RATE,
+                channels=1,
+                dtype='int16',
+                blocksize=BLOCK_SIZE,
+                callback=self._out_callback
+            )
+            self.output_stream.start()
+        except Exception as e:
+            print(f"FATAL: Could not start audio playback: {e}")
+            self.output_stream = None
+            return
+        self._playing = True
+        self._playback_thread = threading.Thread(target=self._playback_loop, daemon=True)
+        self._playback_thread.start()
+
+    def _playback_loop(self):
+        """Decodes packets from the jitter buffer and queues them for the output stream."""
+        while self._playing:
+            # The timeout lets the loop notice stop_playback() even if no audio arrives.
+            packet = self._jitter_buffer.get(0.5)
+            if packet is not None:
+                self.play_audio(packet)
+
+    def stop_playback(self):
+        """Stops the playback thread and the output stream."""
+        if not self.output_stream:
+            return
+        self._playing = False
+        self._jitter_buffer.wake()
+        self._playback_thread.join()
+        self._playback_thread = None
+        self.output_stream.stop()
+        self.output_stream.close()
+        self.output_stream = None
 
-            # Apply speaker boost
-            float_array = audio_array.astype(np.float32) / 32768.0 # Normalize to -1.0 to 1.0
-            float_array *= 10 ** (self.speaker_boost_db / 20) # Apply boost
-            float_array = np.clip(float_array, -1.0, 1.0) # Clamp to prevent clipping
-            audio_array = (float_array * 32767.0).astype(np.int16) # Denormalize and convert back
+    def queue_audio(self, encoded_packet: bytes):
+        """
+        Queues a received Opus packet for playback and returns immediately.
+        The packet is decoded on the playback thread, so it must not be modified afterwards.
+        """
+        self._jitter_buffer.put(encoded_packet)
 
-            # Reshape the array to be 2D: (n_samples, n_channels) which is (480, 1) here.
-            self.output_stream.write(audio_array.reshape(-1, 1))
+    def play_audio(self, encoded_packet: bytes):
+        """
+        Decodes an Opus packet and queues it for playback on the output device.
+        Packets from the network should go through queue_audio() instead; this decodes
+        on the calling thread and must not be used at the same time as queue_audio().
+        """
+        if not self.output_stream:
+            # Playback could not be started, see _start_playback().
+            return
+
+        # Decode the packet into an int16 view of the decoder's buffer and play it
+        audio_array = self.decoder.decode(encoded_packet)
+        if audio_array is not None:
+            # Apply speaker boost in a single int32 pass. At 0dB there is nothing to do.
+            if self._gain_fixed != UNITY_GAIN:
+                boosted = audio_array.astype(np.int32)
+                boosted *= self._gain_fixed
+                boosted >>= GAIN_SHIFT
+                np.clip(boosted, -32768, 32767, out=boosted) # Clamp to prevent wrap-around
+                audio_array = boosted.astype(np.int16)
+
+            # Queue the audio one device block at a time. If the ring is full the rest
+            # of the packet is dropped rather than adding more latency.
+            for start in range(0, len(audio_array), BLOCK_SIZE):
+                if not self._out_ring.push(audio_array[start:start + BLOCK_SIZE]):
+                    break
 
 def list_audio_devices():
     """A utility function to print all available audio devices."""
@@ -139,41 +407,39 @@ def test_sine_wave_playback(frequency=440, duration_seconds=5):
     # The amplitude is scaled to fit within the range of a 16-bit integer.
     amplitude = 0.2 * 32767
 
-    # Generate a time array for the duration of the sound
-    t = np.linspace(0., duration_seconds, int(SAMPLE_RATE * duration_seconds), endpoint=False)
-    # Generate the sine wave data as int16
-    sine_data = (amplitude * np.sin(2. * np.pi * frequency * t)).astype(np.int16)
+    # The tone is generated one block at a time from a running phase, so only a
+    # single block of samples is ever held in memory.
+    num_blocks = -(-int(SAMPLE_RATE * duration_seconds) // BLOCK_SIZE)
+    phase_step = 2. * np.pi * frequency / SAMPLE_RATE
+    phase_ramp = np.arange(BLOCK_SIZE, dtype=np.float32) * np.float32(phase_step)
+    block_phase = 0.
+    wave = np.empty(BLOCK_SIZE, dtype=np.float32)
+    chunk = np.empty(BLOCK_SIZE, dtype=np.int16)
 
     # 2. Setup Encoder, Decoder
-    encoder = pyogg.OpusEncoder()
-    encoder.set_application('voip')
-    encoder.set_sampling_frequency(SAMPLE_RATE)
-    encoder.set_channels(1)
-
-    decoder = pyogg.OpusDecoder()
-    decoder.set_sampling_frequency(SAMPLE_RATE)
-    decoder.set_channels(1)
+    encoder = OpusEncoder(SAMPLE_RATE, channels=1)
+    decoder = OpusDecoder(SAMPLE_RATE, channels=1)
 
     try:
         # 3. Setup Output Stream
         with sd.OutputStream(samplerate=SAMPLE_RATE, channels=1, dtype='int16', blocksize=BLOCK_SIZE) as stream:
             print(f"Playing {duration_seconds}-second tone...")
-            # 4. Process the sine wave in chunks
-            for i in range(0, len(sine_data), BLOCK_SIZE):
-                chunk = sine_data[i:i+BLOCK_SIZE]
-
-                # If the last chunk is smaller than BLOCK_SIZE, pad it with silence
-                if len(chunk) < BLOCK_SIZE:
-                    chunk = np.pad(chunk, (0, BLOCK_SIZE - len(chunk)), 'constant')
+            # 4. Generate and process the sine wave in chunks
+            for _ in range(num_blocks):
+                np.add(phase_ramp, np.float32(block_phase), out=wave)
+                np.sin(wave, out=wave)
+                wave *= amplitude
+                np.copyto(chunk, wave, casting='unsafe')
+                # Keep the running phase small so float32 precision does not degrade.
+                block_phase = (block_phase + BLOCK_SIZE * phase_step) % (2. * np.pi)
 
                 # Encode -> Decode
-                encoded_packet = encoder.encode(chunk.tobytes())
-                decoded_pcm = decoder.decode(encoded_packet)
+                encoded_packet = encoder.encode(chunk)
+                playback_array = decoder.decode(encoded_packet)
 
-                if decoded_pcm:
-                    # Prepare for playback and write to the stream
-                    playback_array = np.frombuffer(decoded_pcm, dtype=np.int16)
-                    stream.write(playback_array.reshape(-1, 1))
+                if playback_array is not None:
+                    # Write the decoded audio to the stream
+                    stream.write(playback_array)
             print("Sine wave test finished.")
     except Exception as e:
         print(f"An error occurred during the sine wave test: {e}")
@@ -188,12 +454,17 @@ def test_microphone_loopback():
     print("If the audio is noisy, check your OS microphone gain/boost settings.")
     print("Press Ctrl+C to stop the test.")
 
-    # This list will act as a simple queue between our mic and speaker
-    audio_queue = []
+    # A bounded, blocking queue between our mic and speaker
+    audio_queue = queue.Queue(maxsize=64)
 
     def my_mic_handler(encoded_packet):
         """This function gets called by the AudioManager with encoded audio."""
-        audio_queue.append(encoded_packet)
+        try:
+            # The packet is only valid during this call, so queue a copy of it.
+            audio_queue.put_nowait(bytes(encoded_packet))
+        except queue.Full:
+            # Drop the packet rather than letting latency grow without bound.
+            pass
 
     # Instantiate the manager with our handler, using default devices and no boost.
     manager = AudioManager(
@@ -206,15 +477,17 @@ def test_microphone_loopback():
 
     try:
         while True:
-            if audio_queue:
-                packet = audio_queue.pop(0)
-                manager.play_audio(packet)
-            # A small sleep is important to prevent this loop from consuming 100% CPU.
-            time.sleep(0.001)
+            # Block until a packet arrives. The timeout keeps Ctrl+C responsive.
+            try:
+                packet = audio_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            manager.play_audio(packet)
     except KeyboardInterrupt:
         print("\nMicrophone loopback test stopped by user.")
     finally:
         manager.stop_capture()
+        manager.stop_playback()
 
 if __name__ == '__main__':
     print("--- AudioManager Test Utility ---")
@@ -1,16 +1,23 @@
+import copy
 import os
 import pathlib
-import toml
+import tomli_w
+
+try:
+    # tomllib is part of the standard library from Python 3.11.
+    import tomllib
+except ImportError:
+    import tomli as tomllib
 
 # Follow XDG Base Directory Spec for config files on Linux.
 # This will typically resolve to ~/.config/il2srs/settings.toml
-CONFIG_DIR = pathlib.Path(os.environ.get('XDG_CONFIG_HOME', pathlib.Path.home() / '.config')) / 'il2srl
+CONFIG_DIR = pathlib.Path(os.environ.get('XDG_CONFIG_HOME', pathlib.Path.home() / '.config')) / 'il2srs'
 CONFIG_FILE = CONFIG_DIR / 'settings.toml'
 
 # Define the default structure and values for the configuration.
 # This acts as a template for a new config file.
 DEFAULT_SETTINGS = {
-    'user': {,
+    'user': {
         'pilot_name': 'LinuxPilot',
     },
     'audio': {
@@ -18,6 +25,9 @@ DEFAULT_SETTINGS = {
         'output_device': 'default',
         'mic_output_device': 'None',
         'speaker_boost_db': 0,
+        # CPUs to pin the network receive and audio capture threads to; -1 leaves them unpinned.
+        'net_cpu': -1,
+        'audio_cpu': -1,
     },
     'keybinds': {
         'ptt1': 'KEY_J',
@@ -41,22 +51,51 @@ DEFAULT_SETTINGS = {
     ]
 }
 
+# Settings loaded by load_settings(), so later calls do not re-read the file.
+_settings_cache = None
+
+def _merge_with_defaults(defaults: dict, loaded: dict) -> dict:
+    """
+    Returns a copy of `loaded` with any keys missing from it filled in from `defaults`.
+
+    Nested tables are merged recursively. Any other value (including lists, such as
+    the server list) is taken from `loaded` as a whole if present.
+    """
+    merged = {}
+    for key, default_value in defaults.items():
+        if key not in loaded:
+            merged[key] = copy.deepcopy(default_value)
+        elif isinstance(default_value, dict) and isinstance(loaded[key], dict):
+            merged[key] = _merge_with_defaults(default_value, loaded[key])
+        else:
+            merged[key] = loaded[key]
+    # Keep anything the user has that the defaults don't know about.
+    for key, value in loaded.items():
+        if key not in merged:
+            merged[key] = value
+    return merged
+
 def load_settings():
     """
     Loads settings from the TOML config file.
 
     If the file or directory doesn't exist, it creates them with default values.
     This ensures the application always has a valid configuration to work with.
+    The file is only parsed once; later calls return the cached settings.
 
     Returns:
         A dictionary containing the application settings.
     """
+    global _settings_cache
+    if _settings_cache is not None:
+        return _settings_cache
+
     if not CONFIG_FILE.exists():
         print(f"Config file not found. Creating default config at: {CONFIG_FILE}")
         try:
             CONFIG_DIR.mkdir(parents=True, exist_ok=True)
-            with open(CONFIG_FILE, 'w') as f:
-                toml.dump(DEFAULT_SETTINGS, f)
+            with open(CONFIG_FILE, 'wb') as f:
+                tomli_w.dump(DEFAULT_SETTINGS, f)
         except IOError as e:
             print(f"FATAL: Could not write default config file: {e}")
             # Return the hardcoded defaults as a fallback in case of write error
@@ -64,17 +103,20 @@ def load_settings():
             return DEFAULT_SETTINGS
 
     try:
-        with open(CONFIG_FILE, 'r') as f:
-            settings = toml.load(f)
+        with open(CONFIG_FILE, 'rb') as f:
+            loaded = tomllib.load(f)
             print(f"Loaded settings from {CONFIG_FILE}")
-            # TODO: Add logic here to merge loaded settings with defaults
-            # to ensure new settings from updates are added to the user's file.
-            return settings
-    except (toml.TomlDecodeError, IOError) as e:
+    except (tomllib.TOMLDecodeError, IOError) as e:
         print(f"FATAL: Could not read or parse config file: {e}")
         print("Using default settings")
         return DEFAULT_SETTINGS
 
+    # Fill in settings added by updates, so callers can rely on every key existing.
+    # This happens in memory only; the user's file (and its comments) is left untouched.
+    settings = _merge_with_defaults(DEFAULT_SETTINGS, loaded)
+    _settings_cache = settings
+    return settings
+
 def save_settings(settings: dict):
     """
     Saves the provided settings dictionary to the TOML config file.
@@ -82,10 +124,12 @@ def save_settings(settings: dict):
     Args:
         settings: The dictionary of settings to save.
     """
+    global _settings_cache
     try:
         CONFIG_DIR.mkdir(parents=True, exist_ok=True)
-        with open(CONFIG_FILE, 'w') as f:
-            toml.dump(settings, f)
+        with open(CONFIG_FILE, 'wb') as f:
+            tomli_w.dump(settings, f)
+        _settings_cache = settings
     except IOError as e:
         print(f"ERROR: Could not save settings to {CONFIG_FILE}: {e}")
 
@@ -5,20 +5,29 @@ import struct
 UDP_PORT = 4322
 SRS_ADDRESS_MSG_TYPE = 12
 CLIENT_DATA_MSG_TYPE = 13
+# Kernel receive buffer for the game socket, large enough to absorb bursts of telemetry.
+RECV_BUFFER_BYTES = 1 << 20
 
+# Precompiled layout of the STClientData event payload: two 4-byte signed longs
+# and a 32-byte char array, little-endian.
+_CLIENT_DATA = struct.Struct('<ll32s')
 
-def find_srs_data_from_packet(data: bytes):
+
+def find_srs_data_from_packet(data):
     """
     Parses a raw UDP packet from IL-2
         finds SRS address and pilot name
 
     Args:
-        data: The raw bytes received from the UDP socket.
+        data: The raw packet received from the UDP socket, as bytes or a memoryview.
 
     Returns:
         A tuple containing (srs_address, pilot_name). Either can be None
         if not found in the packet.
     """
+    # Slicing a memoryview does not copy, so payloads are only materialized
+    # as bytes when a string actually needs decoding.
+    data = memoryview(data)
     try:
         # In C#, a MemoryStream is used. In Python, we can simply track our
         # position in the byte array with an 'offset' variable.
@@ -29,7 +38,8 @@ def find_srs_data_from_packet(data: bytes):
 
         # C#: int indicatorCount = stream.ReadByte();
         # The next byte tells us how many "indicator structs" there are.
-        indicator_count, = struct.unpack_from('<B', data, offset)
+        # Indexing bytes yields an int directly, which is cheaper than struct.unpack_from.
+        indicator_count = data[offset]
         offset += 1
 
         # This loop skips over all the indicator data blocks.
@@ -37,14 +47,14 @@ def find_srs_data_from_packet(data: bytes):
             # C#: stream.Seek(2, SeekOrigin.Current);
             offset += 2
             # C#: uint indicators = (uint) stream.ReadByte();
-            indicators, = struct.unpack_from('<B', data, offset)
+            indicators = data[offset]
             offset += 1
             # C#: stream.Seek(4*indicators, SeekOrigin.Current);
             offset += (4 * indicators)
 
         # C#: int eventCount = stream.ReadByte();
         # Now we've reached the event data. This byte tells us how many events follow.
-        event_count, = struct.unpack_from('<B', data, offset)
+        event_count = data[offset]
         offset += 1
 
         srs_address = None
@@ -54,17 +64,17 @@ def find_srs_data_from_packet(data: bytes):
         for _ in range(event_count):
             # C#: int msgTypeInt = BitConverter.ToUInt16(new[] {part1, part2}, 0);
             # The message type is a 2-byte unsigned short (little-endian).
-            msg_type, = struct.unpack_from('<H', data, offset)
+            msg_type = data[offset] | (data[offset + 1] << 8)
             offset += 2
 
             # C#: uint eventSize = (uint) stream.ReadByte();
             # The event size is a 1-byte unsigned integer.
-            event_size, = struct.unpack_from('<B', data, offset)
+            event_size = data[offset]
             offset += 1
 
             if msg_type == SRS_ADDRESS_MSG_TYPE:
                 # We found it! The payload of this event is the address string.
-                payload_bytes = data[offset : offset + event_size]
+                payload_bytes = data[offset : offset + event_size].tobytes()
                 # The string is ASCII and terminated by a null character (\x00).
                 srs_address = payload_bytes.split(b'\x00', 1)[0].decode('ascii')
             if msg_type == CLIENT_DATA_MSG_TYPE:
@@ -76,8 +86,7 @@ def find_srs_data_from_packet(data: bytes):
                 };"""
                 #payload_bytes = data[offset +8 : offset + event_size]
                 # The format is two 4-byte signed longs and a 32-byte char array.
-                # '<' for little-endian, 'l' for signed long, '32s' for 32-byte string.
-                client_id, server_client_id, pilot_name_bytes = struct.unpack_from('<ll32s', data, offset)
+                client_id, server_client_id, pilot_name_bytes = _CLIENT_DATA.unpack_from(data, offset)
                 
                 # Decode the name and strip any trailing null bytes.
                 pilot_name = pilot_name_bytes.split(b'\x00', 1)[0].decode('ascii', 'ignore')
@@ -106,6 +115,7 @@ def listen_for_game_data():
     """
     # Create a UDP socket (AF_INET for IPv4, SOCK_DGRAM for UDP)
     with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
         # Bind the socket to all available network interfaces on the specified port.
         try:
             sock.bind(("", UDP_PORT))
@@ -121,11 +131,20 @@ def listen_for_game_data():
         found_srs_address = None
         found_pilot_name = None
 
+        # Receive every packet into the same buffer instead of allocating a new
+        # bytes object per packet. 2048 is a safe buffer size.
+        buf = bytearray(2048)
+        buf_view = memoryview(buf)
+
         while not (found_srs_address and found_pilot_name):
-            # Wait and receive a packet. 2048 is a safe buffer size.
-            data, _ = sock.recvfrom(2048)
-            
-            srs_address, pilot_name = find_srs_data_from_packet(data)
+            # Wait and receive a packet.
+            nbytes = sock.recv_into(buf)
+
+            result = find_srs_data_from_packet(buf_view[:nbytes])
+            if result is None:
+                # Malformed or unrelated packet.
+                continue
+            srs_address, pilot_name = result
 
             if srs_address and not found_srs_address:
                 found_srs_address = srs_address
@@ -1,14 +1,33 @@
+import asyncio
+import os
+import struct
 import threading
 import time
-import select
+import pyudev
 from evdev import InputDevice, list_devices, ecodes
 
+# Layout of the kernel's struct input_event: a struct timeval (two native longs),
+# then type (u16), code (u16) and value (s32). Reading and unpacking events directly
+# avoids creating an evdev InputEvent object for every event.
+_EV_STRUCT = struct.Struct('llHHi')
+# Maximum number of events fetched from a device per read.
+_EV_READ_SIZE = _EV_STRUCT.size * 64
+
+# High-volume event types from mice, joysticks and the kernel's report separators.
+# These never carry button presses, so they are dropped before PTT dispatch.
+_IGNORED_EVENT_TYPES = frozenset((ecodes.EV_SYN, ecodes.EV_REL, ecodes.EV_ABS))
+
+# Seconds between device rescans when udev hotplug notifications are unavailable.
+_RESCAN_INTERVAL = 2.0
+
 class KeyHandler:
     """
     Manages input device monitoring for Push-to-Talk (PTT) keys.
 
     This class scans for specified input devices and monitors them in a background
     thread for key presses and releases, triggering callbacks when PTT events occur.
+    The thread runs an asyncio event loop that only wakes up when a device has input
+    or udev reports a newly connected device.
     It reads directly from /dev/input/event* devices, making it compatible with
     both X11 and Wayland.
     """
@@ -29,9 +48,19 @@ class KeyHandler:
         self.ptt2_key_code = self._parse_key(keybinds.get('ptt2'))
         self.verbose = verbose
 
-        self.monitored_devices = []
+        # Map each bound key code to its callback so the event loop needs a single lookup.
+        # PTT1 is inserted last so it wins if both PTTs are bound to the same key.
+        self._ptt_map = {
+            code: callback
+            for code, callback in ((self.ptt2_key_code, ptt2_callback), (self.ptt1_key_code, ptt1_callback))
+            if code is not None
+        }
+
+        self.monitored_devices = {}  # A map of {file_descriptor: InputDevice}
         self.is_running = False
         self.monitor_thread = None
+        self._loop = None
+        self._udev_monitor = None
 
     def _parse_key(self, key_string: str):
         """
@@ -56,6 +85,7 @@ class KeyHandler:
 
         print("Starting key monitoring...")
         self.is_running = True
+        self._loop = asyncio.new_event_loop()
         self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
         self.monitor_thread.start()
 
@@ -67,82 +97,150 @@ class KeyHandler:
             return
         print("Stopping key monitoring...")
         self.is_running = False
-        # The thread will exit on its own. We can join if we need to wait for cleanup.
+        # Stopping the event loop makes the thread clean up and exit.
+        try:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        except RuntimeError:
+            # The loop has already shut down on its own.
+            pass
         if self.monitor_thread:
             self.monitor_thread.join()
 
     def _monitor_loop(self):
         """
-        The main loop for the monitoring thread. It scans for devices and listens for events.
+        The main loop for the monitoring thread. It registers every input device and
+        the udev hotplug monitor with the event loop, then runs it until stopped.
         """
-        # Use poll() for robustness, as it has no file descriptor limit like select().
-        poller = select.poll()
-        monitored_devices = {}  # A map of {file_descriptor: InputDevice}
-
-        while self.is_running:
+        loop = self._loop
+        asyncio.set_event_loop(loop)
+        loop.set_exception_handler(self._on_loop_error)
+        try:
+            # --- Hotplug Notifications ---
+            # udev tells us about newly connected devices, so there is no need to rescan.
             try:
-                # --- Device Discovery ---
-                # Periodically rescan to find newly connected devices.
-                device_paths = list_devices()
-                current_device_paths = {dev.path for dev in monitored_devices.values()}
-
-                for path in device_paths:
-                    if path not in current_device_paths:
-                        try:
-                            dev = InputDevice(path)
-                            print(f"Now monitoring: {dev.name} ({dev.path})")
-                            # Register the device's file descriptor for input events.
-                            poller.register(dev.fd, select.POLLIN)
-                            monitored_devices[dev.fd] = dev
-                        except (OSError, IOError):
-                            # This can happen if a device is unplugged right as we try to open it.
-                            continue
-
-                if not monitored_devices:
-                    print("No input devices found. Waiting...")
-                    time.sleep(5)
-                    continue
-
-                # --- Event Polling ---
-                # Wait for an event on any registered device, with a 1-second timeout.
-                # The timeout allows the loop to check self.is_running and rescan for devices.
-                events = poller.poll(1000)  # 1000ms timeout
-
-                for fd, _ in events:
-                    device = monitored_devices[fd]
-                    try:
-                        for event in device.read():
-                            # --- Verbose Logging for Debugging ---
-                            if self.verbose:
-                                print(f"[{device.name}] Event: type={event.type}, code={event.code}, value={event.value}")
-
-                            # We only care about press (1) and release (0) events.
-                            # 'hold' events (value 2) are ignored to prevent repeated callbacks.
-                            if event.value in [0, 1]:
-                                is_pressed = event.value == 1
-                                # Check for the PTT key codes directly, regardless of event type (e.g., EV_KEY, EV_MSC).
-                                # This adds robustness for devices like Steam Controllers that might use different event types for virtual buttons.
-                                if event.code == self.ptt1_key_code:
-                                    self.ptt1_callback(is_pressed)
-                                elif event.code == self.ptt2_key_code:
-                                    self.ptt2_callback(is_pressed)
-                    except (OSError, IOError):
-                        # Device was unplugged. Unregister and remove it.
-                        print(f"Device disconnected: {device.name}")
-                        poller.unregister(fd)
-                        device.close()
-                        del monitored_devices[fd]
+                udev_monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+                udev_monitor.filter_by(subsystem='input')
+                udev_monitor.start()
+                loop.add_reader(udev_monitor.fileno(), self._on_hotplug)
+                self._udev_monitor = udev_monitor
+            except Exception as e:
+                # e.g. in containers or sandboxes without netlink access or udevd.
+                print(f"udev hotplug monitoring unavailable ({e}). Rescanning for devices every {_RESCAN_INTERVAL:g}s instead.")
+                loop.call_later(_RESCAN_INTERVAL, self._rescan_devices)
+
+            # --- Device Discovery ---
+            permission_denied = False
+            for path in list_devices():
+                try:
+                    self._add_device(path)
+                except PermissionError:
+                    permission_denied = True
+
+            if not self.monitored_devices:
+                if permission_denied:
+                    print("\nFATAL: Permission denied to read from /dev/input/*.")
+                    print("Please add your user to the 'input' group:")
+                    print("  sudo usermod -a -G input $USER")
+                    print("Then, log out and log back in for the change to take effect.")
+                    self.is_running = False
+                    return
+                print("No input devices found. Waiting for one to be connected...")
+
+            loop.run_forever()
+        finally:
+            for fd, device in list(self.monitored_devices.items()):
+                loop.remove_reader(fd)
+                device.close()
+            self.monitored_devices.clear()
+            if self._udev_monitor:
+                loop.remove_reader(self._udev_monitor.fileno())
+                self._udev_monitor = None
+            loop.close()
+            self.is_running = False
+
+    def _on_loop_error(self, loop, context):
+        """Reports errors raised by event loop callbacks without stopping monitoring."""
+        print(f"Error in key monitor loop: {context.get('exception', context['message'])}")
+
+    def _add_device(self, path: str):
+        """Opens an input device and registers it with the event loop, if not already monitored."""
+        if any(device.path == path for device in self.monitored_devices.values()):
+            return
+        try:
+            device = InputDevice(path)
+        except PermissionError:
+            raise
+        except (OSError, IOError):
+            # This can happen if a device is unplugged right as we try to open it.
+            return
+        print(f"Now monitoring: {device.name} ({device.path})")
+        self.monitored_devices[device.fd] = device
+        # Register the device's file descriptor for input events.
+        self._loop.add_reader(device.fd, self._read_device, device.fd)
+
+    def _remove_device(self, fd: int):
+        """Unregisters and closes a monitored device."""
+        self._loop.remove_reader(fd)
+        device = self.monitored_devices.pop(fd)
+        device.close()
+
+    def _on_hotplug(self):
+        """Called when udev reports input subsystem changes; opens newly added event devices."""
+        udev_device = self._udev_monitor.poll(timeout=0)
+        while udev_device is not None:
+            node = udev_device.device_node
+            if udev_device.action == 'add' and node and node.startswith('/dev/input/event'):
+                try:
+                    self._add_device(node)
+                except PermissionError:
+                    print(f"Permission denied to read {node}. Ignoring.")
+            udev_device = self._udev_monitor.poll(timeout=0)
 
+    def _rescan_devices(self):
+        """Opens any input devices connected since the last scan, then schedules the next scan."""
+        for path in list_devices():
+            try:
+                self._add_device(path)
             except PermissionError:
-                print("\nFATAL: Permission denied to read from /dev/input/*.")
-                print("Please add your user to the 'input' group:")
-                print("  sudo usermod -a -G input $USER")
-                print("Then, log out and log back in for the change to take effect.")
-                self.is_running = False
-                break
-            except Exception as e:
-                print(f"Error in key monitor loop: {e}")
-                time.sleep(5) # Avoid spamming errors
+                # Already reported at startup; keep scanning for accessible devices.
+                pass
+        self._loop.call_later(_RESCAN_INTERVAL, self._rescan_devices)
+
+    def _read_device(self, fd: int):
+        """Called when a device has input; reads the pending events and dispatches PTT presses."""
+        device = self.monitored_devices[fd]
+        try:
+            raw = os.read(fd, _EV_READ_SIZE)
+        except BlockingIOError:
+            # Nothing left to read after all.
+            return
+        except (OSError, IOError):
+            # Device was unplugged. Unregister and remove it.
+            print(f"Device disconnected: {device.name}")
+            self._remove_device(fd)
+            return
+
+        # Bind what the event loop touches per event to locals, which are cheaper
+        # to access than instance attributes and module globals.
+        ptt_lookup = self._ptt_map.get
+        verbose = self.verbose
+        ignored_types = _IGNORED_EVENT_TYPES
+
+        for _sec, _usec, event_type, code, value in _EV_STRUCT.iter_unpack(raw):
+            # --- Verbose Logging for Debugging ---
+            if verbose:
+                print(f"[{device.name}] Event: type={event_type}, code={code}, value={value}")
+
+            if event_type in ignored_types:
+                continue
+
+            # Check for the PTT key codes directly, regardless of event type (e.g., EV_KEY, EV_MSC).
+            # This adds robustness for devices like Steam Controllers that might use different event types for virtual buttons.
+            callback = ptt_lookup(code)
+            # We only care about press (1) and release (0) events.
+            # 'hold' events (value 2) are ignored to prevent repeated callbacks.
+            if callback is not None and value in (0, 1):
+                callback(value == 1)
 
 if __name__ == '__main__':
     # Example usage for testing
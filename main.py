@@ -1,4 +1,4 @@
-import time
+import logging
 import sys
 from threading import Event
 
@@ -8,6 +8,8 @@ from audio import AudioManager
 from srsServerHandler import SrsServerClient, ReceivedVoice
 from keyHandler import KeyHandler
 
+log = logging.getLogger("srs")
+
 class SrsRadioClient:
     """
     The main application class that integrates all modules.
@@ -21,30 +23,47 @@ class SrsRadioClient:
 
         self.ptt1_pressed = False
         self.ptt2_pressed = False
+        # Set while either PTT is held. The AudioManager only encodes mic audio while it is set.
+        self._transmit_gate = Event()
 
     def _handle_received_audio(self, voice_data: ReceivedVoice):
         """Callback for the SrsServerClient to pass received audio to the AudioManager."""
         if self.audio_manager:
-            # The audio payload is raw Opus data, which is what play_audio expects.
-            self.audio_manager.play_audio(voice_data.audio_payload)
-
-    def _handle_mic_capture(self, encoded_packet: bytes):
-        """Callback for the AudioManager to pass encoded mic data to the SrsServerClient."""
+            # The audio payload is raw Opus data. Queue it in the jitter buffer, so this
+            # network thread goes straight back to receiving.
+            self.audio_manager.queue_audio(voice_data.audio_payload)
+
+    def _handle_mic_capture(self, encoded_packet: memoryview):
+        """
+        Callback for the AudioManager to pass encoded mic data to the SrsServerClient.
+        The packet is a view of the encoder's buffer and is only valid during this call.
+        """
         if self.srs_server_client and self.srs_server_client.is_running:
+            # The voice packet does not carry the radio number, so transmitting on both
+            # radios would send the same audio twice. Send it once.
             if self.ptt1_pressed:
                 self.srs_server_client.send_voice_packet(encoded_packet, radio_num=1)
-            if self.ptt2_pressed:
+            elif self.ptt2_pressed:
                 self.srs_server_client.send_voice_packet(encoded_packet, radio_num=2)
 
+    def _update_transmit_gate(self):
+        """Opens the transmit gate while any PTT is held and closes it otherwise."""
+        if self.ptt1_pressed or self.ptt2_pressed:
+            self._transmit_gate.set()
+        else:
+            self._transmit_gate.clear()
+
     def _handle_ptt1(self, is_pressed: bool):
         """Callback for KeyHandler on PTT1 event."""
         self.ptt1_pressed = is_pressed
-        print(f"PTT1 {'Pressed' if is_pressed else 'Released'}")
+        self._update_transmit_gate()
+        log.debug("PTT1 %s", 'Pressed' if is_pressed else 'Released')
 
     def _handle_ptt2(self, is_pressed: bool):
         """Callback for KeyHandler on PTT2 event."""
         self.ptt2_pressed = is_pressed
-        print(f"PTT2 {'Pressed' if is_pressed else 'Released'}")
+        self._update_transmit_gate()
+        log.debug("PTT2 %s", 'Pressed' if is_pressed else 'Released')
 
     def run(self):
         """Starts and runs the client application."""
@@ -78,7 +97,9 @@ class SrsRadioClient:
             input_device=self.settings['audio']['input_device'],
             output_device=self.settings['audio']['output_device'],
             encoded_mic_callback=self._handle_mic_capture,
-            speaker_boost_db=self.settings['audio']['speaker_boost_db']
+            speaker_boost_db=self.settings['audio']['speaker_boost_db'],
+            audio_cpu=self.settings['audio']['audio_cpu'],
+            transmit_gate=self._transmit_gate
         )
 
         # 4. Initialize and Connect SRS Client
@@ -87,12 +108,15 @@ class SrsRadioClient:
             server_address=server_ip,
             server_port=server_port,
             pilot_name=final_pilot_name,
-            received_audio_callback=self._handle_received_audio
+            received_audio_callback=self._handle_received_audio,
+            net_cpu=self.settings['audio']['net_cpu']
         )
         self.srs_server_client.connect()
 
         if not self.srs_server_client.is_running:
             print("Failed to connect to SRS server. Exiting.")
+            # The audio manager's speaker stream and playback thread are already running.
+            self._cleanup()
             return
 
         # 5. Start Audio Capture and Main Loop
@@ -109,19 +133,27 @@ class SrsRadioClient:
 
         print("\nClient is running. Press Ctrl+C to exit.")
         try:
-            while not self._stop_event.is_set():
-                # The main loop can be used for tasks like checking keybinds.
-                # For now, just keep the app alive.
-                time.sleep(1)
+            # Everything runs on background threads; just keep the app alive until
+            # shutdown is requested. wait() returns as soon as the event is set.
+            self._stop_event.wait()
         except KeyboardInterrupt:
             print("\nShutdown signal received.")
         finally:
-            print("Cleaning up...")
-            if self.srs_server_client: self.srs_server_client.disconnect()
-            if self.audio_manager: self.audio_manager.stop_capture()
-            if self.key_handler: self.key_handler.stop_monitoring()
-            print("Client has been shut down. Goodbye.")
+            self._cleanup()
+
+    def _cleanup(self):
+        """Stops every component that has been started so far."""
+        print("Cleaning up...")
+        if self.srs_server_client and self.srs_server_client.is_running:
+            self.srs_server_client.disconnect()
+        if self.audio_manager:
+            self.audio_manager.stop_capture()
+            self.audio_manager.stop_playback()
+        if self.key_handler: self.key_handler.stop_monitoring()
+        print("Client has been shut down. Goodbye.")
 
 if __name__ == '__main__':
+    # Per-event messages are logged at DEBUG; set the level to logging.DEBUG to see them.
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     client = SrsRadioClient()
     client.run()
\ No newline at end of file
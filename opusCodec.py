@@ -0,0 +1,152 @@
+import ctypes
+import ctypes.util
+import numpy as np
+
+# Constants from libopus' opus_defines.h
+OPUS_OK = 0
+OPUS_APPLICATION_VOIP = 2048
+
+# Recommended maximum size of a single encoded Opus packet.
+MAX_PACKET_BYTES = 4000
+# The longest frame Opus can decode is 120ms, which is 5760 samples at 48kHz.
+MAX_FRAME_SAMPLES = 5760
+
+def _load_libopus():
+    """
+    Loads the system libopus and declares the signatures of the functions we use.
+    Calling libopus directly lets us encode from and decode into persistent buffers,
+    with no intermediate bytes objects per frame.
+    """
+    path = ctypes.util.find_library('opus')
+    if not path:
+        raise OSError("libopus not found. Please install it with your package manager (e.g. libopus0).")
+    lib = ctypes.CDLL(path)
+
+    lib.opus_strerror.argtypes = [ctypes.c_int]
+    lib.opus_strerror.restype = ctypes.c_char_p
+
+    lib.opus_encoder_create.argtypes = [ctypes.c_int32, ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+    lib.opus_encoder_create.restype = ctypes.c_void_p
+    lib.opus_encode.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_int32]
+    lib.opus_encode.restype = ctypes.c_int32
+    lib.opus_encoder_destroy.argtypes = [ctypes.c_void_p]
+    lib.opus_encoder_destroy.restype = None
+
+    lib.opus_decoder_create.argtypes = [ctypes.c_int32, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+    lib.opus_decoder_create.restype = ctypes.c_void_p
+    lib.opus_decode.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int32, ctypes.c_void_p, ctypes.c_int, ctypes.c_int]
+    lib.opus_decode.restype = ctypes.c_int
+    lib.opus_decoder_destroy.argtypes = [ctypes.c_void_p]
+    lib.opus_decoder_destroy.restype = None
+    return lib
+
+_lib = _load_libopus()
+
+def _error_string(code: int) -> str:
+    """Returns libopus' description of an error code."""
+    return _lib.opus_strerror(code).decode('ascii', 'replace')
+
+def _as_pointer_arg(data):
+    """
+    Returns an object ctypes can pass as a pointer to the bytes of `data`.
+    bytes and writable buffers are passed without copying.
+    """
+    if isinstance(data, bytes):
+        return data
+    try:
+        return (ctypes.c_char * len(data)).from_buffer(data)
+    except TypeError:
+        # Read-only buffer, e.g. a memoryview of bytes.
+        return bytes(data)
+
+class OpusEncoder:
+    """
+    Encodes 16-bit PCM into Opus packets using libopus directly.
+    """
+    def __init__(self, sample_rate: int, channels: int = 1, application: int = OPUS_APPLICATION_VOIP):
+        """
+        Initializes the encoder.
+
+        Args:
+            sample_rate: The sample rate of the PCM input, in Hz.
+            channels: The number of interleaved channels in the PCM input.
+            application: The Opus application mode (OPUS_APPLICATION_VOIP by default).
+        """
+        error = ctypes.c_int()
+        self._encoder = _lib.opus_encoder_create(sample_rate, channels, application, ctypes.byref(error))
+        if error.value != OPUS_OK:
+            self._encoder = None
+            raise OSError(f"Could not create Opus encoder: {_error_string(error.value)}")
+        self.channels = channels
+
+        # Encoded packets are written into this buffer and handed out as views of it.
+        self._packet_buf = bytearray(MAX_PACKET_BYTES)
+        self._packet_ptr = (ctypes.c_char * MAX_PACKET_BYTES).from_buffer(self._packet_buf)
+        self._packet_view = memoryview(self._packet_buf)
+
+    def encode(self, pcm: np.ndarray) -> memoryview:
+        """
+        Encodes one frame of audio.
+
+        Args:
+            pcm: A C-contiguous int16 array holding one Opus frame (e.g. 480 samples per channel).
+
+        Returns:
+            A memoryview of the encoded packet. It points into the encoder's own buffer
+            and is only valid until the next call to encode(); copy it to keep it.
+        """
+        frame_size = len(pcm) // self.channels
+        result = _lib.opus_encode(self._encoder, pcm.ctypes.data, frame_size, self._packet_ptr, MAX_PACKET_BYTES)
+        if result < 0:
+            raise OSError(f"Opus encoding failed: {_error_string(result)}")
+        return self._packet_view[:result]
+
+    def __del__(self):
+        if getattr(self, '_encoder', None):
+            _lib.opus_encoder_destroy(self._encoder)
+            self._encoder = None
+
+class OpusDecoder:
+    """
+    Decodes Opus packets into 16-bit PCM using libopus directly.
+    """
+    def __init__(self, sample_rate: int, channels: int = 1):
+        """
+        Initializes the decoder.
+
+        Args:
+            sample_rate: The sample rate to decode to, in Hz.
+            channels: The number of channels to decode to.
+        """
+        error = ctypes.c_int()
+        self._decoder = _lib.opus_decoder_create(sample_rate, channels, ctypes.byref(error))
+        if error.value != OPUS_OK:
+            self._decoder = None
+            raise OSError(f"Could not create Opus decoder: {_error_string(error.value)}")
+        self.channels = channels
+
+        # Decoded PCM is written into this array and handed out as views of it.
+        self._pcm = np.zeros(MAX_FRAME_SAMPLES * channels, dtype=np.int16)
+        self._pcm_ptr = self._pcm.ctypes.data
+
+    def decode(self, packet) -> np.ndarray:
+        """
+        Decodes one Opus packet.
+
+        Args:
+            packet: The encoded packet, as bytes or any other bytes-like object.
+
+        Returns:
+            An int16 array view of the decoded PCM, or None if the packet could not be decoded.
+            The view points into the decoder's own buffer and is only valid until the next
+            call to decode().
+        """
+        samples = _lib.opus_decode(self._decoder, _as_pointer_arg(packet), len(packet), self._pcm_ptr, MAX_FRAME_SAMPLES, 0)
+        if samples < 0:
+            return None
+        return self._pcm[:samples * self.channels]
+
+    def __del__(self):
+        if getattr(self, '_decoder', None):
+            _lib.opus_decoder_destroy(self._decoder)
+            self._decoder = None
@@ -0,0 +1,55 @@
+from typing import List, Optional, Union
+import msgspec
+
+# Typed schemas for the JSON messages on the SRS TCP control channel.
+# msgspec encodes and decodes these in C straight from/to the struct fields,
+# without building intermediate dicts.
+
+class Radio(msgspec.Struct):
+    """One radio in a client's GameState."""
+    name: str
+    channel: int = 0
+    freq: int = 0
+    secFreq: int = 0
+    retransmit: bool = False
+    volume: float = 1.0
+    modulation: int = 0
+
+class GameStateMsg(msgspec.Struct):
+    """The client's radio setup, sent with RADIO_UPDATE messages."""
+    radios: List[Radio]
+    control: int = 0
+    onboard: bool = False
+    ptt: bool = False
+
+class ClientMsg(msgspec.Struct):
+    """The "Client" part of a message sent to the server."""
+    ClientGuid: str
+    Name: str
+    Coalition: int = 0 # 0=Spectator, 1=Allies, 2=Axis
+    Seat: int = 0
+    # Left out of the JSON entirely unless set. The struct class has a different name
+    # from this field, as the field's default would otherwise shadow it in the annotation.
+    GameState: Union[GameStateMsg, msgspec.UnsetType] = msgspec.UNSET
+
+class SrsMsg(msgspec.Struct):
+    """A message sent from this client to the server."""
+    MsgType: str
+    ServerType: str
+    Version: str
+    Client: ClientMsg
+
+class ServerMsg(msgspec.Struct):
+    """
+    A message received from the server. Only the common top-level fields are typed;
+    fields not listed here are skipped by the decoder.
+    """
+    MsgType: Union[str, int]
+    Version: str = ""
+    Client: Optional[dict] = None
+    Clients: Optional[list] = None
+    ServerSettings: Optional[dict] = None
+
+# Reusable encoder/decoder instances, so their setup is not repeated per message.
+encoder = msgspec.json.Encoder()
+server_msg_decoder = msgspec.json.Decoder(ServerMsg)
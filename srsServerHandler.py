@@ -3,8 +3,16 @@ import threading
 import time
 import struct
 import uuid
-import json
+import itertools
+import logging
+import msgspec
+import selectors
 from collections import namedtuple
+from typing import Callable, Union
+from udpBatch import BatchReceiver
+import srsMessages
+from srsMessages import SrsMsg, ClientMsg, GameStateMsg, Radio
+from threadPriority import make_current_thread_realtime
 
 # Constants for the Simple Radio Standalone (SRS) protocol.
 # Based on analysis of compatible client implementations.
@@ -17,6 +25,10 @@ PACKET_ID_VOICE = 2
 # Named tuple for received voice data for clarity. The IL-2 SRS server doesn't send sender GUID with voice.
 ReceivedVoice = namedtuple('ReceivedVoice', ['audio_payload', 'sender_guid'])
 
+# Per-message output goes through this logger rather than print(), so it costs
+# next to nothing unless debug logging is enabled.
+log = logging.getLogger("srs")
+
 # Packet IDs from Client to Server
 PACKET_ID_CLIENT_VOICE = 1
 PACKET_ID_CLIENT_UPDATE = 2 # Radio Info Update
@@ -32,11 +44,24 @@ JSON_MSG_TYPE_PING = "PING"
 SERVER_TYPE = "IL2-SRS"
 CLIENT_VERSION = "1.0.0.0" # A dummy version to satisfy the server.
 
+# Socket tuning for the voice path.
+UDP_RECV_BUFFER_BYTES = 1 << 20 # Absorbs bursts of voice packets
+VOICE_IP_TOS = 0xb8 # DSCP Expedited Forwarding, the standard marking for voice
+VOICE_SOCKET_PRIORITY = 6 # Highest Linux qdisc priority allowed without CAP_NET_ADMIN
+
+# Packet ID at the start of every voice packet (uint64, little-endian).
+# Compiled once so the format string is not parsed again for each packet.
+_HDR_STRUCT = struct.Struct('<Q')
+
+# Longest control message we accept. A server that sends more than this without a
+# newline is broken or hostile, and the connection is dropped instead of buffering it.
+MAX_TCP_MESSAGE_BYTES = 1 << 20
+
 class SrsServerClient:
     """
     Manages the TCP connection and communication with an SRS server.
     """
-    def __init__(self, server_address: str, server_port: int, pilot_name: str, received_audio_callback: callable):
+    def __init__(self, server_address: str, server_port: int, pilot_name: str, received_audio_callback: Callable[[ReceivedVoice], None], net_cpu: int = -1):
         """
         Initializes the SRS network client.
 
@@ -46,6 +71,8 @@ class SrsServerClient:
             pilot_name: The name of the user/client.
             received_audio_callback: A function to call with a ReceivedVoice named tuple
                                      when a voice packet is received.
+            net_cpu: CPU to pin the network receive thread to (ideally the one handling the
+                     network card's interrupts), or -1 to leave it unpinned.
         """
         self.server_address = server_address
         self.server_port = server_port
@@ -53,15 +80,50 @@ class SrsServerClient:
         if not self.pilot_name:
             self.pilot_name = "LinuxPilot" # Added a default name
         self.received_audio_callback = received_audio_callback
+        self.net_cpu = net_cpu
 
         self.client_guid = str(uuid.uuid4())
         self.tcp_sock = None
         self.udp_sock = None
-        self.voice_packet_id = 0 # Sequentially increasing ID for voice packets
+        self._server_addr = None # Resolved (ip, port) of the server, set on connect
+        # Sequentially increasing IDs for voice packets, starting at 1. The counter is
+        # advanced in C by next(), so concurrent senders never get the same ID.
+        self._voice_packet_ids = itertools.count(1)
         self.is_running = False
+        # Set by disconnect() to wake the ping thread immediately instead of after its sleep.
+        self._shutdown = threading.Event()
         self.ping_thread = None
-        self.tcp_receive_thread = None
-        self.udp_receive_thread = None
+        self.io_thread = None
+
+        # Receive state for the IO thread's handlers, reset on every connect().
+        self._tcp_buffer = bytearray()
+        self._tcp_read_pos = 0  # Start of the first unprocessed message in the buffer
+        self._tcp_scan_pos = 0  # Everything before this has already been searched for a newline
+        self._udp_receiver = None # BatchReceiver for the current UDP socket
+        self._udp_packets = []
+
+        # The voice packet header is built once; only its packet ID changes per packet.
+        # The GUID part never changes for the session.
+        self._guid_suffix = self.client_guid.encode('utf-8') + b'\x00'
+        self._header_buf = bytearray(_HDR_STRUCT.size + len(self._guid_suffix))
+        self._header_buf[_HDR_STRUCT.size:] = self._guid_suffix
+
+        # Every message carries the same client identity.
+        self._client_msg = ClientMsg(ClientGuid=self.client_guid, Name=self.pilot_name)
+
+        # Everything in a RADIO_UPDATE except the two channel numbers is fixed, so the
+        # message is built once and only the channels are changed before each send.
+        self._template_radios = [Radio(name="Radio 1"), Radio(name="Radio 2")]
+        self._radio_update_msg = SrsMsg(
+            MsgType=JSON_MSG_TYPE_RADIO_UPDATE,
+            ServerType=SERVER_TYPE,
+            Version=CLIENT_VERSION,
+            Client=ClientMsg(
+                ClientGuid=self.client_guid,
+                Name=self.pilot_name,
+                GameState=GameStateMsg(radios=self._template_radios)
+            )
+        )
 
     def connect(self):
         """Establishes a connection to the SRS server and starts the listener thread."""
@@ -73,24 +135,44 @@ class SrsServerClient:
             print(f"Connecting to SRS server at {self.server_address}:{self.server_port}...")
             # Setup TCP socket for control messages
             self.tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # Control messages are small; send them immediately instead of batching.
+            self.tcp_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.tcp_sock.connect((self.server_address, self.server_port))
             print("TCP connection successful.")
+            # Reuse the address the TCP connection resolved to for every voice packet,
+            # rather than building (and possibly re-resolving) it on each send.
+            self._server_addr = self.tcp_sock.getpeername()
 
             # Setup UDP socket for voice. It binds to the same local port as the TCP socket.
             self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECV_BUFFER_BYTES)
+            # Mark voice traffic for priority handling by routers and the local queueing discipline.
+            self.udp_sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, VOICE_IP_TOS)
+            if hasattr(socket, 'SO_PRIORITY'):
+                self.udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_PRIORITY, VOICE_SOCKET_PRIORITY)
             self.udp_sock.bind(self.tcp_sock.getsockname())
             print(f"UDP socket bound to {self.tcp_sock.getsockname()}")
+            # Connect the UDP socket to the server so the kernel fixes the destination
+            # once, and voice packets can be sent without an address argument.
+            # A connected UDP socket reports ICMP port-unreachable replies as
+            # ConnectionRefusedError on its next send or receive; both paths ignore it.
+            self.udp_sock.connect(self._server_addr)
+
+            # Fresh receive state for this connection.
+            self._tcp_buffer.clear()
+            self._tcp_read_pos = 0
+            self._tcp_scan_pos = 0
+            # Pull every queued voice packet with a single system call where possible.
+            # It never blocks, so a stale readiness report cannot stall the TCP side.
+            self._udp_receiver = BatchReceiver(self.udp_sock, batch_size=64, max_packet_size=4096)
 
             self._perform_handshake()
 
             self.is_running = True
-            # Start thread for TCP control messages
-            self.tcp_receive_thread = threading.Thread(target=self._tcp_receive_loop, daemon=True)
-            self.tcp_receive_thread.start()
-
-            # Start thread for UDP voice packets
-            self.udp_receive_thread = threading.Thread(target=self._udp_receive_loop, daemon=True)
-            self.udp_receive_thread.start()
+            self._shutdown.clear()
+            # Start one thread for both TCP control messages and UDP voice packets
+            self.io_thread = threading.Thread(target=self._io_loop, daemon=True)
+            self.io_thread.start()
 
             self.ping_thread = threading.Thread(target=self._ping_loop, daemon=True)
             self.ping_thread.start()
@@ -99,7 +181,9 @@ class SrsServerClient:
 
         except (socket.error, OSError, OverflowError) as e:
             print(f"FATAL: Could not connect to SRS server: {e}")
-            self.disconnect()
+            self.is_running = False
+            self._shutdown.set()
+            self._close_sockets(self.tcp_sock, self.udp_sock)
 
     def disconnect(self):
         """Disconnects from the server and stops the listener thread."""
@@ -109,15 +193,35 @@ class SrsServerClient:
 
         print("Disconnecting from SRS server...")
         self.is_running = False
-        if self.tcp_sock:
-            self.tcp_sock.close()
+        self._shutdown.set()
+        # Wait for the IO thread to finish, so a connect() right after this returns never
+        # overlaps with the old thread's cleanup. Shutting down the TCP socket wakes its
+        # select() straight away instead of after the timeout.
+        io_thread = self.io_thread
+        if io_thread and io_thread is not threading.current_thread():
+            try:
+                self.tcp_sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, AttributeError):
+                # Already closed or disconnected.
+                pass
+            io_thread.join()
+        self._close_sockets(self.tcp_sock, self.udp_sock)
+
+    def _close_sockets(self, tcp_sock, udp_sock):
+        """
+        Closes the given sockets and clears the matching attributes, but only if they
+        still refer to them, so a newer connection's sockets are never touched.
+        """
+        if self.tcp_sock is tcp_sock:
             self.tcp_sock = None
-        if self.udp_sock:
-            self.udp_sock.close()
+        if self.udp_sock is udp_sock:
             self.udp_sock = None
-        # No need to join daemon threads, but it can be good practice if they hold resources.
+        if tcp_sock:
+            tcp_sock.close()
+        if udp_sock:
+            udp_sock.close()
 
-    def _send_json_message(self, msg_type: str, client_data: dict = None):
+    def _send_json_message(self, msg_type: str) -> None:
         """Constructs and sends a JSON message to the server."""
         if not self.is_running or not self.tcp_sock:
             return
@@ -125,101 +229,145 @@ class SrsServerClient:
         if msg_type == JSON_MSG_TYPE_PING:
             return
 
-        message = {
-            "MsgType": msg_type,
-            "ServerType": SERVER_TYPE,
-            "Version": CLIENT_VERSION,
-            "Client": {
-                "ClientGuid": self.client_guid,
-                "Name": self.pilot_name,
-                "Coalition": 0, # 0=Spectator, 1=Allies, 2=Axis
-                "Seat": 0,
-            }
-        }
-        if client_data:
-            message["Client"].update(client_data)
+        message = SrsMsg(
+            MsgType=msg_type,
+            ServerType=SERVER_TYPE,
+            Version=CLIENT_VERSION,
+            Client=self._client_msg
+        )
 
         # The server expects a JSON string followed by a newline.
-        json_string = json.dumps(message) + "\n"
-        packet = json_string.encode('utf-8')
+        # msgspec serializes straight to UTF-8 bytes.
+        packet = srsMessages.encoder.encode(message) + b"\n"
         self.tcp_sock.sendall(packet)
 
     def _ping_loop(self):
         """Sends a ping to the server every 10 seconds to keep the connection alive."""
         while self.is_running:
             try:
-                # The server has a 5-second timeout. We send a ping, then sleep.
+                # The server has a 5-second timeout. We send a ping, then wait.
                 # This ensures the server always receives a packet within its timeout window.
                 self._send_ping()
-                time.sleep(4)
             except Exception:
                 # The main receive loop will handle the disconnect.
                 break
+            # Returns True as soon as disconnect() is called, so the thread exits promptly.
+            if self._shutdown.wait(4):
+                break
 
     def _perform_handshake(self):
         """Sends the initial SYNC message to the server."""
         self._send_json_message(JSON_MSG_TYPE_SYNC)
         print("Handshake (SYNC) message sent.")
 
-    def _tcp_receive_loop(self):
-        """Continuously listens for data from the server."""
-        buffer = bytearray()
-        while self.is_running:
-            try:
-                # Read data from the socket and add it to our buffer
-                data = self.tcp_sock.recv(4096)
-                if not data:
-                    print("Connection closed by server.")
-                    break
-                buffer.extend(data)
-
-                # Process all complete packets in the buffer
-                # The server sends newline-terminated JSON messages.
-                while b'\n' in buffer:
-                    packet_data, buffer = buffer.split(b'\n', 1)
-                    if packet_data:
-                        try:
-                            # The server sends JSON, but the client's _parse_packet
-                            # expects binary. This part would also need to be rewritten
-                            # to handle JSON messages from the server.
-                            # For now, we just print it.
-                            message = json.loads(packet_data.decode('utf-8'))
-                            print(f"Received JSON from server: {message}")
-                            # self._parse_json_message(message) # A new method would be needed
-                        except (json.JSONDecodeError, UnicodeDecodeError) as e:
-                            print(f"Could not decode server message: {e}")
-                            print(f"Raw data: {packet_data}")
-                        
-            # This part of the original code is for a different protocol.
-            except ConnectionResetError:
-                print("Connection was forcibly closed by the remote host.")
-                break
-            except Exception as e:
-                if self.is_running:
-                    print(f"Error in receive loop: {e}")
-                break
-        
-        self.is_running = False
-        print("TCP receive loop stopped.")
-
-    def _udp_receive_loop(self):
-        """Continuously listens for UDP voice packets from the server."""
-        print("UDP receive loop started.")
-        while self.is_running:
-            try:
-                # For IL-2 SRS, the UDP packet is just the raw Opus audio.
-                # The header is added by the client, not the server.
-                data, _ = self.udp_sock.recvfrom(4096)
-                if data:
-                    # The server doesn't tell us who sent the audio in the packet itself.
-                    # We just receive a mix. The sender_guid is therefore None.
-                    voice_data = ReceivedVoice(audio_payload=data, sender_guid=None)
-                    self.received_audio_callback(voice_data)
-            except Exception as e:
-                if self.is_running:
-                    print(f"Error in UDP receive loop: {e}")
+    def _io_loop(self):
+        """
+        Waits for data on both the TCP control socket and the UDP voice socket and
+        dispatches to the matching handler. One thread serves both channels.
+        """
+        print("Network receive loop started.")
+        # Received voice should be handled as soon as it lands, not when the scheduler gets to it.
+        if not make_current_thread_realtime(self.net_cpu):
+            print("Realtime priority unavailable for the network thread (needs CAP_SYS_NICE).")
+
+        # The sockets of the connection this thread serves. Only these are closed on exit.
+        tcp_sock, udp_sock = self.tcp_sock, self.udp_sock
+
+        # epoll on Linux. Each registration carries its handler as the key's data.
+        sel = selectors.DefaultSelector()
+        sel.register(tcp_sock, selectors.EVENT_READ, self._handle_tcp_readable)
+        sel.register(udp_sock, selectors.EVENT_READ, self._handle_udp_readable)
+        try:
+            while self.is_running:
+                # The timeout lets the loop notice disconnect() even if nothing arrives.
+                for key, _mask in sel.select(timeout=0.5):
+                    key.data()
+        except ConnectionResetError:
+            print("Connection was forcibly closed by the remote host.")
+        except Exception as e:
+            if self.is_running:
+                print(f"Error in receive loop: {e}")
+        finally:
+            sel.close()
+
+        # The loop also ends when the server closes the connection or misbehaves, e.g. an
+        # oversize frame; close the sockets then too rather than leaving them open.
+        # The connection state is only reset if no newer connection has replaced this one.
+        if self.io_thread is threading.current_thread():
+            self.is_running = False
+            self._shutdown.set()
+        self._close_sockets(tcp_sock, udp_sock)
+        print("Network receive loop stopped.")
+
+    def _handle_tcp_readable(self) -> None:
+        """Reads from the TCP socket and processes every complete message received."""
+        data = self.tcp_sock.recv(4096)
+        if not data:
+            # Also seen when disconnect() shuts the socket down to wake this thread.
+            if self.is_running:
+                print("Connection closed by server.")
+            self.is_running = False
+            return
+        buffer = self._tcp_buffer
+        buffer.extend(data)
+        read_pos = self._tcp_read_pos
+        scan_pos = self._tcp_scan_pos
+
+        # Process all complete packets in the buffer
+        # The server sends newline-terminated JSON messages. Messages are located
+        # by index, so each byte is scanned once and the tail is never re-copied.
+        while True:
+            newline = buffer.find(b'\n', scan_pos)
+            if newline < 0:
+                scan_pos = len(buffer)
                 break
-        print("UDP receive loop stopped.")
+            packet_data = buffer[read_pos:newline]
+            read_pos = scan_pos = newline + 1
+            if packet_data:
+                try:
+                    # The server sends JSON, but the client's _parse_packet
+                    # expects binary. This part would also need to be rewritten
+                    # to handle JSON messages from the server.
+                    # For now, we just log it.
+                    # msgspec parses the raw bytes into a ServerMsg, including UTF-8 validation.
+                    message = srsMessages.server_msg_decoder.decode(packet_data)
+                    log.debug("Received JSON from server: %s", message)
+                    # self._parse_json_message(message) # A new method would be needed
+                except msgspec.DecodeError as e:
+                    log.warning("Could not decode server message: %s", e)
+                    # Only the start of the line; a malformed one can be up to a megabyte.
+                    log.debug("Raw data: %s", packet_data[:256])
+
+        if len(buffer) - read_pos > MAX_TCP_MESSAGE_BYTES:
+            raise ConnectionError("oversize frame from server")
+
+        # Drop processed messages from the front of the buffer once in a while,
+        # or straight away if nothing is left (which is cheap).
+        if read_pos == len(buffer) or read_pos > 65536:
+            del buffer[:read_pos]
+            scan_pos -= read_pos
+            read_pos = 0
+        self._tcp_read_pos = read_pos
+        self._tcp_scan_pos = scan_pos
+
+    def _handle_udp_readable(self) -> None:
+        """Receives the queued UDP voice packets and passes them to the audio callback."""
+        # For IL-2 SRS, the UDP packet is just the raw Opus audio.
+        # The header is added by the client, not the server.
+        packets = self._udp_packets
+        try:
+            self._udp_receiver.receive_into(packets)
+        except ConnectionRefusedError:
+            # An earlier voice packet hit a closed UDP port on the server. That says
+            # nothing about the control connection, so keep going.
+            log.debug("Voice packet refused by the server")
+            return
+        for data in packets:
+            if data:
+                # The server doesn't tell us who sent the audio in the packet itself.
+                # We just receive a mix. The sender_guid is therefore None.
+                voice_data = ReceivedVoice(audio_payload=data, sender_guid=None)
+                self.received_audio_callback(voice_data)
 
     def _parse_json_message(self, message: dict):
         """Parses an incoming JSON message from the server."""
@@ -227,12 +375,12 @@ class SrsServerClient:
         pass
 
 
-    def send_voice_packet(self, encoded_opus_packet: bytes, radio_num: int):
+    def send_voice_packet(self, encoded_opus_packet: Union[bytes, memoryview], radio_num: int) -> None:
         """
         Wraps an Opus packet in the SRS protocol format and sends it.
         Args:
-            encoded_opus_packet: The Opus-encoded audio data.
-            frequency: The transmission frequency.
+            encoded_opus_packet: The Opus-encoded audio data, e.g. the memoryview returned by
+                                 OpusEncoder.encode(). It is sent before this call returns.
             radio_num: The radio number being used (e.g., 1 or 2).
         """
         if not self.is_running or not self.udp_sock:
@@ -244,23 +392,24 @@ class SrsServerClient:
             # - Client GUID (variable length string, UTF-8 encoded, null-terminated)
             # - Opus Audio (the rest of the packet)
 
-            self.voice_packet_id += 1
-            
-            # Pack the header
-            guid_bytes = self.client_guid.encode('utf-8') + b'\x00'
-            header = struct.pack('<Q', self.voice_packet_id) + guid_bytes
+            packet_id = next(self._voice_packet_ids)
 
-            # Construct the full UDP packet
-            packet = header + encoded_opus_packet
+            # Update the packet ID in the prebuilt header
+            _HDR_STRUCT.pack_into(self._header_buf, 0, packet_id)
 
-            # Send to the server using the UDP socket
-            self.udp_sock.sendto(packet, (self.server_address, self.server_port))
+            # Send header and audio as one datagram. sendmsg gathers both buffers in the
+            # kernel, so the packet is never concatenated or copied in Python.
+            self.udp_sock.sendmsg([self._header_buf, encoded_opus_packet])
 
+        except ConnectionRefusedError:
+            # The server's UDP port answered an earlier packet with ICMP port-unreachable.
+            # Voice is best-effort, so drop this packet and keep the connection.
+            log.debug("Voice packet refused by the server")
         except Exception as e:
             print(f"Error sending voice packet: {e}")
             self.disconnect()
 
-    def send_radio_update(self, radio1_channel: int, radio2_channel: int):
+    def send_radio_update(self, radio1_channel: int, radio2_channel: int) -> None:
         """
         Sends the current radio channel selection to the server.
         This must be called whenever the user changes their active radio channels.
@@ -274,18 +423,9 @@ class SrsServerClient:
 
         try:
             # The server expects radio updates via the JSON protocol.
-            client_data = {
-                "GameState": {
-                    "radios": [
-                        {"channel": radio1_channel, "freq": 0, "secFreq": 0, "retransmit": False, "volume": 1.0, "modulation": 0, "name": "Radio 1"},
-                        {"channel": radio2_channel, "freq": 0, "secFreq": 0, "retransmit": False, "volume": 1.0, "modulation": 0, "name": "Radio 2"}
-                    ],
-                    "control": 0,
-                    "onboard": False,
-                    "ptt": False
-                }
-            }
-            self._send_json_message(JSON_MSG_TYPE_RADIO_UPDATE, client_data)
+            self._template_radios[0].channel = radio1_channel
+            self._template_radios[1].channel = radio2_channel
+            self.tcp_sock.sendall(srsMessages.encoder.encode(self._radio_update_msg) + b"\n")
             #print("Radio update sent.") # This can be noisy, commenting out.
         except Exception as e:
             print(f"Error sending radio update: {e}")
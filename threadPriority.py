@@ -0,0 +1,47 @@
+import os
+
+# SCHED_FIFO priority for latency-critical threads. High enough to run ahead of
+# normal threads, but below the kernel's own realtime threads (typically 50).
+REALTIME_PRIORITY = 20
+
+def make_current_thread_realtime(cpu: int = -1, priority: int = REALTIME_PRIORITY) -> bool:
+    """
+    Gives the calling thread realtime scheduling and optionally pins it to one CPU.
+
+    A thread that already has realtime scheduling at or above `priority` is left as it is.
+    Switching to SCHED_FIFO needs CAP_SYS_NICE (or an RLIMIT_RTPRIO limit that allows it);
+    without it the thread keeps running normally. Neither call is available outside Linux.
+
+    Args:
+        cpu: The CPU to pin the thread to, e.g. the one handling the network card's
+             interrupts. A negative value leaves the affinity unchanged.
+        priority: The SCHED_FIFO priority to request.
+
+    Returns:
+        True if realtime scheduling was enabled, False otherwise.
+    """
+    # On Linux, pid 0 refers to the calling thread, not the whole process.
+    if cpu >= 0 and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError:
+            # e.g. the CPU does not exist or is not allowed for this process.
+            pass
+
+    if not hasattr(os, 'sched_setscheduler'):
+        return False
+    try:
+        # Some audio backends (JACK, PortAudio's ALSA realtime mode) already run their
+        # threads with realtime scheduling. Only ever raise the priority, never lower it.
+        policy = os.sched_getscheduler(0)
+        if policy in (os.SCHED_FIFO, os.SCHED_RR):
+            if os.sched_getparam(0).sched_priority >= priority:
+                return True
+        elif policy not in (os.SCHED_OTHER, os.SCHED_BATCH, os.SCHED_IDLE):
+            # Some other realtime policy (e.g. SCHED_DEADLINE); leave it alone.
+            return True
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except OSError:
+        # Usually PermissionError: no realtime privileges.
+        return False
+    return True
@@ -0,0 +1,123 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+
+# recvmmsg flag: block until at least one datagram arrives, then return
+# whatever else is already queued without waiting for the whole batch.
+MSG_WAITFORONE = 0x10000
+# Never block, even if no datagram is queued after all.
+MSG_DONTWAIT = 0x40
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_IoVec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_hdr', _MsgHdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+def _load_recvmmsg():
+    """Returns libc's recvmmsg function, or None if it is not available (e.g. not on Linux)."""
+    path = ctypes.util.find_library('c')
+    if not path:
+        return None
+    libc = ctypes.CDLL(path, use_errno=True)
+    try:
+        recvmmsg = libc.recvmmsg
+    except AttributeError:
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+_recvmmsg = _load_recvmmsg()
+
+class BatchReceiver:
+    """
+    Receives datagrams from a UDP socket in batches.
+
+    On Linux this uses recvmmsg, so a single system call returns every datagram that
+    is already queued on the socket (up to `batch_size`). The receive buffers are
+    allocated once up front. Elsewhere it falls back to one recv_into call per datagram,
+    still into the preallocated buffers.
+    """
+    def __init__(self, sock: socket.socket, batch_size: int = 64, max_packet_size: int = 4096):
+        """
+        Initializes the receiver.
+
+        Args:
+            sock: A bound UDP socket.
+            batch_size: The maximum number of datagrams returned by one receive_into() call.
+            max_packet_size: The size of each receive buffer. Longer datagrams are truncated.
+        """
+        self.sock = sock
+        self._fd = sock.fileno()
+        self.batch_size = batch_size
+        self.max_packet_size = max_packet_size
+
+        # One contiguous arena holds all receive buffers.
+        self._arena = (ctypes.c_char * (batch_size * max_packet_size))()
+        self._arena_view = memoryview(self._arena).cast('B')
+        self._iovecs = (_IoVec * batch_size)()
+        self._msgs = (_MMsgHdr * batch_size)()
+        base = ctypes.addressof(self._arena)
+        for i in range(batch_size):
+            self._iovecs[i].iov_base = base + i * max_packet_size
+            self._iovecs[i].iov_len = max_packet_size
+            self._msgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            self._msgs[i].msg_hdr.msg_iovlen = 1
+
+    def receive_into(self, packets: list) -> int:
+        """
+        Receives every datagram already queued on the socket, without blocking. Meant to
+        be called once a selector reports the socket readable; if the datagram has gone
+        by then (e.g. dropped for a bad checksum), it returns 0.
+
+        Args:
+            packets: A list that is cleared and then filled with the received datagrams
+                     as bytes objects. Reusing the same list avoids allocating one per batch.
+
+        Returns:
+            The number of datagrams received, which may be 0.
+        """
+        packets.clear()
+        if _recvmmsg is None:
+            # Receive into the first arena slot and copy out only the bytes received.
+            try:
+                nbytes = self.sock.recv_into(self._arena_view[:self.max_packet_size], 0, getattr(socket, 'MSG_DONTWAIT', 0))
+            except BlockingIOError:
+                return 0
+            packets.append(bytes(self._arena_view[:nbytes]))
+            return 1
+
+        while True:
+            count = _recvmmsg(self._fd, self._msgs, self.batch_size, MSG_WAITFORONE | MSG_DONTWAIT, None)
+            if count >= 0:
+                break
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return 0
+            if err != errno.EINTR:
+                raise OSError(err, os.strerror(err))
+
+        for i in range(count):
+            start = i * self.max_packet_size
+            packets.append(bytes(self._arena_view[start:start + self._msgs[i].msg_len]))
+        return count